@@ -1,181 +1,427 @@
-import json
-import math
+import asyncio
+import hashlib
+import io
 import os
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Optional
 
 import discord
 from discord.ext import commands
 from discord import app_commands
 from dotenv import load_dotenv
+import orjson
 
 # ========================
 # CONFIG
 # ========================
 
 PAGE_SIZE = 10
+LEADERBOARD_CACHE_PAGES = 100
 DB_PATH = "/data/reputation.db"
+DB_MMAP_SIZE = 256 * 1024 * 1024
+DB_CACHE_SIZE_KIB = 64000
+DB_CACHED_STATEMENTS = 256
+COMMAND_HASH_PATH = os.path.join(os.path.dirname(DB_PATH), ".command_hash")
 REP_PER_LEVEL = 20
 MAX_REP_PER_TARGET_PER_24H = 3
+REP_WINDOW_SECONDS = 24 * 60 * 60
 REP_HISTORY_PAGE_SIZE = 15
+USER_CACHE_SIZE = 4096
+USER_CACHE_TTL = 600
+FETCH_USER_CONCURRENCY = 5
+MAX_IMPORT_BYTES = 5 * 1024 * 1024
 
-RANK_EMOJIS = {
-    1: "🥇",
-    2: "🥈",
-    3: "🥉",
-}
+RANK_EMOJIS = ("🥇", "🥈", "🥉")
 
 # ========================
-# LOAD TOKEN
+# SQLITE SETUP + MIGRATION
 # ========================
 
-load_dotenv()
-TOKEN = os.getenv("DISCORD_TOKEN")
-if not TOKEN:
-    raise ValueError("DISCORD_TOKEN missing")
+def open_db(path: str = DB_PATH) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
 
-# ========================
-# SQLITE SETUP + MIGRATION
-# ========================
+    conn = sqlite3.connect(
+        path,
+        check_same_thread=False,
+        timeout=10,
+        cached_statements=DB_CACHED_STATEMENTS,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KIB}")
+    return conn
 
-def get_db():
-    return sqlite3.connect(DB_PATH, check_same_thread=False, timeout=10)
+CONN: Optional[sqlite3.Connection] = None
+DB_LOCK = threading.Lock()
 
-def init_db():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+SCHEMA_VERSION = 3
 
-    with get_db() as conn:
-        conn.execute("PRAGMA journal_mode=WAL")
+def init_db():
+    with DB_LOCK, CONN:
+        if CONN.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
 
-        conn.execute("""
+        CONN.execute("""
         CREATE TABLE IF NOT EXISTS reputation (
             user_id INTEGER PRIMARY KEY,
             rep INTEGER NOT NULL,
-            updated_at TEXT
+            updated_at INTEGER
         )
         """)
-        conn.commit()
 
-        cols = [r[1] for r in conn.execute("PRAGMA table_info(reputation)").fetchall()]
+        cols = [r[1] for r in CONN.execute("PRAGMA table_info(reputation)").fetchall()]
         if "neg_rep" not in cols:
-            conn.execute(
+            CONN.execute(
                 "ALTER TABLE reputation ADD COLUMN neg_rep INTEGER NOT NULL DEFAULT 0"
             )
-            conn.commit()
 
-        conn.execute("""
+        col_types = {r[1]: r[2] for r in CONN.execute("PRAGMA table_info(reputation)").fetchall()}
+        if col_types["updated_at"].upper() != "INTEGER":
+            CONN.execute("BEGIN")
+            CONN.execute("""
+            CREATE TABLE reputation_new (
+                user_id INTEGER PRIMARY KEY,
+                rep INTEGER NOT NULL,
+                updated_at INTEGER,
+                neg_rep INTEGER NOT NULL DEFAULT 0
+            )
+            """)
+            CONN.execute("""
+            INSERT INTO reputation_new (user_id, rep, updated_at, neg_rep)
+            SELECT user_id, rep, CAST(strftime('%s', updated_at) AS INTEGER), neg_rep
+            FROM reputation
+            """)
+            CONN.execute("DROP TABLE reputation")
+            CONN.execute("ALTER TABLE reputation_new RENAME TO reputation")
+            CONN.commit()
+
+        CONN.execute("""
         CREATE TABLE IF NOT EXISTS rep_history (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             giver_id INTEGER NOT NULL,
             receiver_id INTEGER NOT NULL,
-            given_at TEXT NOT NULL
+            given_at INTEGER NOT NULL
         )
         """)
-        conn.commit()
 
-init_db()
+        col_types = {r[1]: r[2] for r in CONN.execute("PRAGMA table_info(rep_history)").fetchall()}
+        if col_types["given_at"].upper() != "INTEGER":
+            CONN.execute("BEGIN")
+            CONN.execute("""
+            CREATE TABLE rep_history_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                giver_id INTEGER NOT NULL,
+                receiver_id INTEGER NOT NULL,
+                given_at INTEGER NOT NULL
+            )
+            """)
+            CONN.execute("""
+            INSERT INTO rep_history_new (id, giver_id, receiver_id, given_at)
+            SELECT id, giver_id, receiver_id, CAST(strftime('%s', given_at) AS INTEGER)
+            FROM rep_history
+            """)
+            CONN.execute("DROP TABLE rep_history")
+            CONN.execute("ALTER TABLE rep_history_new RENAME TO rep_history")
+            CONN.commit()
+
+        CONN.execute(
+            "CREATE INDEX IF NOT EXISTS idx_rep_history_pair "
+            "ON rep_history(giver_id, receiver_id, given_at)"
+        )
+        CONN.execute(
+            "CREATE INDEX IF NOT EXISTS idx_rep_history_receiver "
+            "ON rep_history(receiver_id, given_at DESC)"
+        )
+
+        CONN.execute("DROP INDEX IF EXISTS idx_rep_desc")
+        CONN.execute(
+            "CREATE INDEX IF NOT EXISTS idx_rep_rank ON reputation(rep DESC, neg_rep ASC)"
+        )
+
+        CONN.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+# ========================
+# SQL STATEMENTS
+# ========================
+
+SQL_SET_REP = """
+INSERT INTO reputation (user_id, rep, neg_rep, updated_at)
+VALUES (?, ?, ?, ?)
+ON CONFLICT(user_id)
+DO UPDATE SET rep = excluded.rep,
+              neg_rep = excluded.neg_rep,
+              updated_at = excluded.updated_at
+"""
+
+SQL_SET_POSITIVE_REP = """
+INSERT INTO reputation (user_id, rep, neg_rep, updated_at)
+VALUES (?, ?, 0, ?)
+ON CONFLICT(user_id)
+DO UPDATE SET rep = excluded.rep,
+              updated_at = excluded.updated_at
+RETURNING rep, neg_rep
+"""
+
+SQL_SET_NEGATIVE_REP = """
+INSERT INTO reputation (user_id, rep, neg_rep, updated_at)
+VALUES (?, 0, ?, ?)
+ON CONFLICT(user_id)
+DO UPDATE SET neg_rep = excluded.neg_rep,
+              updated_at = excluded.updated_at
+RETURNING rep, neg_rep
+"""
+
+SQL_ADD_POSITIVE_REP = """
+INSERT INTO reputation (user_id, rep, neg_rep, updated_at)
+VALUES (?, ?, 0, ?)
+ON CONFLICT(user_id)
+DO UPDATE SET rep = MAX(0, rep + ?),
+              updated_at = excluded.updated_at
+RETURNING rep, neg_rep
+"""
+
+SQL_ADD_NEGATIVE_REP = """
+INSERT INTO reputation (user_id, rep, neg_rep, updated_at)
+VALUES (?, 0, ?, ?)
+ON CONFLICT(user_id)
+DO UPDATE SET neg_rep = MAX(0, neg_rep + ?),
+              updated_at = excluded.updated_at
+RETURNING rep, neg_rep
+"""
+
+SQL_LEADERBOARD_PAGE = """
+SELECT user_id, rep, neg_rep
+FROM reputation
+ORDER BY rep DESC, neg_rep ASC, user_id ASC
+LIMIT ? OFFSET ?
+"""
+
+SQL_COUNT_REP = "SELECT COUNT(*) FROM reputation"
+
+SQL_REP_STANDING = """
+SELECT me.rep, me.neg_rep, (
+    SELECT 1 + COUNT(*)
+    FROM reputation
+    WHERE rep > me.rep
+       OR (rep = me.rep AND neg_rep < me.neg_rep)
+       OR (rep = me.rep AND neg_rep = me.neg_rep AND user_id < me.user_id)
+)
+FROM reputation AS me
+WHERE me.user_id = ?
+"""
+
+SQL_COUNT_RECENT_REPS = """
+SELECT COUNT(*)
+FROM rep_history
+WHERE giver_id = ? AND receiver_id = ? AND given_at >= ?
+"""
+
+SQL_LOG_REP = """
+INSERT INTO rep_history (giver_id, receiver_id, given_at)
+VALUES (?, ?, ?)
+"""
+
+SQL_RECEIVED_HISTORY = """
+SELECT giver_id, receiver_id, given_at
+FROM rep_history
+WHERE receiver_id = ?
+ORDER BY given_at DESC
+"""
+
+SQL_EXPORT_REP = "SELECT user_id, rep, neg_rep FROM reputation"
 
 # ========================
 # DATABASE HELPERS
 # ========================
 
-def utc_now_iso():
-    return datetime.utcnow().isoformat()
+_REP_VERSION = 0
+_LEADERBOARD_CACHE = {"version": -1, "pages": {}, "standings": {}, "total": None}
+
+def bump_rep_version():
+    global _REP_VERSION
+    _REP_VERSION += 1
+
+def current_leaderboard_cache():
+    if _LEADERBOARD_CACHE["version"] != _REP_VERSION:
+        _LEADERBOARD_CACHE.update(version=_REP_VERSION, pages={}, standings={}, total=None)
+    return _LEADERBOARD_CACHE
+
+def unix_now() -> int:
+    return int(time.time())
 
-def get_rep_data(user_id: int) -> tuple[int, int]:
-    with get_db() as conn:
-        row = conn.execute(
-            "SELECT rep, neg_rep FROM reputation WHERE user_id = ?",
-            (user_id,),
+async def run_db(func, *args):
+    return await asyncio.to_thread(func, *args)
+
+def set_positive_rep(user_id: int, rep: int):
+    with DB_LOCK, CONN:
+        row = CONN.execute(
+            SQL_SET_POSITIVE_REP, (user_id, max(0, rep), unix_now())
+        ).fetchone()
+        bump_rep_version()
+    return row[0], row[1]
+
+def set_negative_rep(user_id: int, neg_rep: int):
+    with DB_LOCK, CONN:
+        row = CONN.execute(
+            SQL_SET_NEGATIVE_REP, (user_id, max(0, neg_rep), unix_now())
         ).fetchone()
-    return (row[0], row[1]) if row else (0, 0)
-
-def set_rep_data(user_id: int, rep: int, neg_rep: int):
-    rep = max(0, rep)
-    neg_rep = max(0, neg_rep)
-
-    with get_db() as conn:
-        conn.execute("""
-        INSERT INTO reputation (user_id, rep, neg_rep, updated_at)
-        VALUES (?, ?, ?, ?)
-        ON CONFLICT(user_id)
-        DO UPDATE SET rep = excluded.rep,
-                      neg_rep = excluded.neg_rep,
-                      updated_at = excluded.updated_at
-        """, (user_id, rep, neg_rep, utc_now_iso()))
-        conn.commit()
-
-def add_positive_rep(user_id: int, amount: int = 1):
-    rep, neg = get_rep_data(user_id)
-    rep += amount
-    set_rep_data(user_id, rep, neg)
-    return rep, neg
+        bump_rep_version()
+    return row[0], row[1]
 
 def add_negative_rep(user_id: int, amount: int = 1):
-    rep, neg = get_rep_data(user_id)
-    neg += amount
-    set_rep_data(user_id, rep, neg)
-    return rep, neg
-
-def get_sorted_rep_items():
-    with get_db() as conn:
-        return conn.execute("""
-            SELECT user_id, rep, neg_rep
-            FROM reputation
-            ORDER BY rep DESC, neg_rep ASC, user_id ASC
-        """).fetchall()
-
-def get_rep_count_last_24h(giver_id: int, receiver_id: int) -> int:
-    cutoff = (datetime.utcnow() - timedelta(hours=24)).isoformat()
-    with get_db() as conn:
-        row = conn.execute("""
-            SELECT COUNT(*)
-            FROM rep_history
-            WHERE giver_id = ? AND receiver_id = ? AND given_at >= ?
-        """, (giver_id, receiver_id, cutoff)).fetchone()
-    return row[0] if row else 0
-
-def log_rep_action(giver_id: int, receiver_id: int):
-    with get_db() as conn:
-        conn.execute("""
-            INSERT INTO rep_history (giver_id, receiver_id, given_at)
-            VALUES (?, ?, ?)
-        """, (giver_id, receiver_id, utc_now_iso()))
-        conn.commit()
-
-def can_give_rep(giver_id: int, receiver_id: int) -> tuple[bool, int]:
-    used = get_rep_count_last_24h(giver_id, receiver_id)
-    remaining = max(0, MAX_REP_PER_TARGET_PER_24H - used)
-    return used < MAX_REP_PER_TARGET_PER_24H, remaining
+    with DB_LOCK, CONN:
+        row = CONN.execute(
+            SQL_ADD_NEGATIVE_REP, (user_id, max(0, amount), unix_now(), amount)
+        ).fetchone()
+        bump_rep_version()
+    return row[0], row[1]
+
+def get_leaderboard_page(page: int):
+    with DB_LOCK:
+        cache = current_leaderboard_cache()
+        rows = cache["pages"].get(page)
+        if rows is None:
+            rows = CONN.execute(
+                SQL_LEADERBOARD_PAGE, (PAGE_SIZE, page * PAGE_SIZE)
+            ).fetchall()
+            if page < LEADERBOARD_CACHE_PAGES:
+                cache["pages"][page] = rows
+    return rows
+
+def get_total_count() -> int:
+    with DB_LOCK:
+        cache = current_leaderboard_cache()
+        if cache["total"] is None:
+            cache["total"] = CONN.execute(SQL_COUNT_REP).fetchone()[0]
+    return cache["total"]
+
+def get_rep_standing(user_id: int) -> tuple[int, int, Optional[int]]:
+    with DB_LOCK:
+        cache = current_leaderboard_cache()
+        standing = cache["standings"].get(user_id)
+        if standing is None:
+            row = CONN.execute(SQL_REP_STANDING, (user_id,)).fetchone()
+            standing = row if row else (0, 0, None)
+            cache["standings"][user_id] = standing
+    return standing
+
+def give_rep(giver_id: int, receiver_id: int) -> Optional[tuple[int, int, int]]:
+    now = unix_now()
+    with DB_LOCK, CONN:
+        CONN.execute("BEGIN IMMEDIATE")
+        used = CONN.execute(
+            SQL_COUNT_RECENT_REPS, (giver_id, receiver_id, now - REP_WINDOW_SECONDS)
+        ).fetchone()[0]
+        if used >= MAX_REP_PER_TARGET_PER_24H:
+            return None
+
+        row = CONN.execute(
+            SQL_ADD_POSITIVE_REP, (receiver_id, 1, now, 1)
+        ).fetchone()
+        CONN.execute(SQL_LOG_REP, (giver_id, receiver_id, now))
+        bump_rep_version()
+    return row[0], row[1], used + 1
 
 def get_received_rep_history(receiver_id: int):
-    with get_db() as conn:
-        rows = conn.execute("""
-            SELECT giver_id, receiver_id, given_at
-            FROM rep_history
-            WHERE receiver_id = ?
-            ORDER BY given_at DESC
-        """, (receiver_id,)).fetchall()
-    return rows
+    with DB_LOCK:
+        return CONN.execute(SQL_RECEIVED_HISTORY, (receiver_id,)).fetchall()
+
+def build_rep_export() -> io.BytesIO:
+    f = io.BytesIO()
+    with DB_LOCK:
+        f.write(b"{")
+        rows = CONN.execute(SQL_EXPORT_REP)
+        for index, (uid, rep, neg) in enumerate(rows):
+            if index:
+                f.write(b",")
+            f.write(b'"%d":' % uid)
+            f.write(orjson.dumps({"reputation": rep, "negative_reputation": neg}))
+        f.write(b"}")
+    f.seek(0)
+    return f
+
+SQLITE_INT_MAX = 2 ** 63 - 1
+
+def normalize_import_value(val) -> tuple[int, int]:
+    if isinstance(val, dict):
+        rep_val = int(val.get("reputation", val.get("rep", 0)))
+        neg_val = int(val.get("negative_reputation", val.get("neg_rep", 0)))
+        return max(0, rep_val), max(0, neg_val)
+    return max(0, int(val)), 0
+
+def normalize_import_row(uid_str: str, val, now: int) -> Optional[tuple[int, int, int, int]]:
+    try:
+        uid = int(uid_str)
+        rep_val, neg_val = normalize_import_value(val)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+    if not 0 < uid <= SQLITE_INT_MAX or rep_val > SQLITE_INT_MAX or neg_val > SQLITE_INT_MAX:
+        return None
+    return uid, rep_val, neg_val, now
+
+def import_rep_json(raw: bytes) -> Optional[tuple[int, int]]:
+    data = orjson.loads(raw)
+    if not isinstance(data, dict):
+        return None
+
+    now = unix_now()
+    rows = (normalize_import_row(uid_str, val, now) for uid_str, val in data.items())
+    rows = [row for row in rows if row]
+
+    with DB_LOCK, CONN:
+        CONN.executemany(SQL_SET_REP, rows)
+        bump_rep_version()
+    return len(rows), len(data) - len(rows)
 
 # ========================
 # UTILITIES
 # ========================
 
+def page_count(total: int) -> int:
+    return max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
+
+@lru_cache(maxsize=4096)
 def get_trading_level(rep: int) -> int:
     return rep // REP_PER_LEVEL
 
+@lru_cache(maxsize=8192)
 def compact_stats(rep: int, neg: int) -> str:
     level = get_trading_level(rep)
     return f"👍 **{rep} Reputation** • 🔰 **Lv. {level}**"
 
-def format_dt(dt_str: str) -> str:
+def format_dt(ts: int) -> str:
     try:
-        dt = datetime.fromisoformat(dt_str)
-        return dt.strftime("%Y-%m-%d %H:%M:%S UTC")
+        return time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime(ts))
     except Exception:
-        return dt_str
+        return str(ts)
+
+_USER_CACHE = OrderedDict()
+_FETCH_USER_SEMAPHORE = asyncio.Semaphore(FETCH_USER_CONCURRENCY)
+
+async def fetch_user_cached(bot: commands.Bot, user_id: int) -> Optional[discord.User]:
+    cached = _USER_CACHE.get(user_id)
+    if cached and cached[0] > time.monotonic():
+        _USER_CACHE.move_to_end(user_id)
+        return cached[1]
+
+    try:
+        async with _FETCH_USER_SEMAPHORE:
+            user = await bot.fetch_user(user_id)
+    except discord.NotFound:
+        user = None
+
+    _USER_CACHE[user_id] = (time.monotonic() + USER_CACHE_TTL, user)
+    _USER_CACHE.move_to_end(user_id)
+    if len(_USER_CACHE) > USER_CACHE_SIZE:
+        _USER_CACHE.popitem(last=False)
+    return user
 
 async def resolve_user_name(guild: discord.Guild, bot: commands.Bot, user_id: int) -> str:
     member = guild.get_member(user_id) if guild else None
@@ -183,10 +429,17 @@ async def resolve_user_name(guild: discord.Guild, bot: commands.Bot, user_id: in
         return member.display_name
 
     try:
-        user = await bot.fetch_user(user_id)
-        return user.name
+        user = await fetch_user_cached(bot, user_id)
     except Exception:
-        return f"User {user_id}"
+        user = None
+    return user.name if user else f"User {user_id}"
+
+async def resolve_user_names(guild: discord.Guild, bot: commands.Bot, user_ids) -> dict[int, str]:
+    unique_ids = list(dict.fromkeys(user_ids))
+    names = await asyncio.gather(
+        *(resolve_user_name(guild, bot, user_id) for user_id in unique_ids)
+    )
+    return dict(zip(unique_ids, names))
 
 def build_rep_history_table(rows):
     lines = []
@@ -204,8 +457,8 @@ def build_rep_history_table(rows):
 # LEADERBOARD EMBED
 # ========================
 
-async def make_leaderboard_embed(items, page, guild, bot, viewer_id: int):
-    total_pages = max(1, math.ceil(len(items) / PAGE_SIZE))
+async def make_leaderboard_embed(page, total, guild, bot, viewer_id: int):
+    total_pages = page_count(total)
     page = max(0, min(page, total_pages - 1))
 
     embed = discord.Embed(
@@ -214,18 +467,22 @@ async def make_leaderboard_embed(items, page, guild, bot, viewer_id: int):
     )
 
     start = page * PAGE_SIZE
-    end = start + PAGE_SIZE
+    items = await run_db(get_leaderboard_page, page)
 
-    for index, (user_id, rep_amount, neg_amount) in enumerate(items[start:end], start=start + 1):
-        member = guild.get_member(user_id)
-        if not member:
-            try:
-                member = await bot.fetch_user(user_id)
-            except Exception:
-                member = None
+    missing = [user_id for user_id, _, _ in items if not guild.get_member(user_id)]
+    fetched = await asyncio.gather(
+        *(fetch_user_cached(bot, user_id) for user_id in missing),
+        return_exceptions=True,
+    )
+    users = {
+        user_id: None if isinstance(user, Exception) else user
+        for user_id, user in zip(missing, fetched)
+    }
 
+    for index, (user_id, rep_amount, neg_amount) in enumerate(items, start=start + 1):
+        member = guild.get_member(user_id) or users.get(user_id)
         name = member.display_name if member else f"User ID {user_id}"
-        medal = RANK_EMOJIS.get(index, f"`#{index}`")
+        medal = RANK_EMOJIS[index - 1] if index <= len(RANK_EMOJIS) else f"`#{index}`"
 
         embed.add_field(
             name=f"{medal} {name}",
@@ -233,13 +490,7 @@ async def make_leaderboard_embed(items, page, guild, bot, viewer_id: int):
             inline=False,
         )
 
-    viewer_rank = None
-    for idx, (uid, _, _) in enumerate(items, start=1):
-        if uid == viewer_id:
-            viewer_rank = idx
-            break
-
-    viewer_rep, viewer_neg = get_rep_data(viewer_id)
+    viewer_rep, viewer_neg, viewer_rank = await run_db(get_rep_standing, viewer_id)
 
     embed.add_field(
         name="━━━━━━━━━━\n👤 Your Stats",
@@ -258,16 +509,24 @@ async def make_leaderboard_embed(items, page, guild, bot, viewer_id: int):
 # ========================
 
 class LeaderboardView(discord.ui.View):
-    def __init__(self, items, guild, bot, author_id):
+    def __init__(self, total, guild, bot, author_id):
         super().__init__(timeout=120)
-        self.items = items
+        self.total = total
         self.guild = guild
         self.bot = bot
         self.author_id = author_id
         self.page = 0
-        self.max_pages = max(1, math.ceil(len(items) / PAGE_SIZE))
+        self.max_pages = page_count(total)
+        self.page_cache = {}
+        self.cache_version = _REP_VERSION
         self.update_buttons()
 
+    @classmethod
+    async def create(cls, total, guild, bot, author_id):
+        view = cls(total, guild, bot, author_id)
+        embed = await view.make_embed()
+        return view, embed
+
     def update_buttons(self):
         self.previous.disabled = self.page <= 0
         self.next.disabled = self.page >= self.max_pages - 1
@@ -281,22 +540,34 @@ class LeaderboardView(discord.ui.View):
             return False
         return True
 
+    async def make_embed(self):
+        if self.cache_version != _REP_VERSION:
+            self.page_cache.clear()
+            self.cache_version = _REP_VERSION
+            self.total = await run_db(get_total_count)
+            self.max_pages = page_count(self.total)
+            self.page = min(self.page, self.max_pages - 1)
+
+        embed = self.page_cache.get(self.page)
+        if embed is None:
+            embed = await make_leaderboard_embed(
+                self.page, self.total, self.guild, self.bot, self.author_id
+            )
+            self.page_cache[self.page] = embed
+        return embed
+
     @discord.ui.button(label="◀ Previous", style=discord.ButtonStyle.secondary)
     async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
         self.page -= 1
+        embed = await self.make_embed()
         self.update_buttons()
-        embed = await make_leaderboard_embed(
-            self.items, self.page, self.guild, self.bot, self.author_id
-        )
         await interaction.response.edit_message(embed=embed, view=self)
 
     @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
     async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
         self.page += 1
+        embed = await self.make_embed()
         self.update_buttons()
-        embed = await make_leaderboard_embed(
-            self.items, self.page, self.guild, self.bot, self.author_id
-        )
         await interaction.response.edit_message(embed=embed, view=self)
 
 class RepHistoryView(discord.ui.View):
@@ -365,14 +636,40 @@ intents = discord.Intents.default()
 intents.members = True
 bot = commands.Bot(command_prefix="!", intents=intents)
 
+def command_tree_hash() -> str:
+    payload = orjson.dumps(
+        {
+            "application_id": bot.application_id,
+            "commands": [command.to_dict(bot.tree) for command in bot.tree.get_commands()],
+        },
+        option=orjson.OPT_SORT_KEYS,
+    )
+    return hashlib.sha256(payload).hexdigest()
+
 @bot.event
-async def on_ready():
+async def setup_hook():
+    tree_hash = command_tree_hash()
+    try:
+        with open(COMMAND_HASH_PATH) as f:
+            synced_hash = f.read().strip()
+    except OSError:
+        synced_hash = None
+
+    if tree_hash == synced_hash:
+        print("Commands unchanged, skipped sync")
+        return
+
     try:
         synced = await bot.tree.sync()
-        print(f"Logged in as {bot.user} | Synced {len(synced)} command(s)")
+        with open(COMMAND_HASH_PATH, "w") as f:
+            f.write(tree_hash)
+        print(f"Synced {len(synced)} command(s)")
     except Exception as e:
         print(f"Command sync failed: {e}")
-        print(f"Logged in as {bot.user}")
+
+@bot.event
+async def on_ready():
+    print(f"Logged in as {bot.user}")
 
 # ========================
 # COMMAND ERROR HANDLER
@@ -408,76 +705,68 @@ async def on_app_command_error(interaction: discord.Interaction, error: app_comm
 # COMMANDS
 # ========================
 
-@bot.tree.command(name="rep", description="Give positive reputation")
-@app_commands.checks.cooldown(1, 240)
-async def rep(interaction: discord.Interaction, member: discord.Member):
+async def _apply_rep(interaction: discord.Interaction, member: discord.Member, give, command: str, action: str):
     if member.bot or member.id == interaction.user.id:
         return await interaction.response.send_message("❌ Invalid target.", ephemeral=True)
 
     await interaction.response.defer()
 
     try:
-        allowed, remaining_before = can_give_rep(interaction.user.id, member.id)
-        if not allowed:
-            return await interaction.followup.send(
-                f"❌ You have already given {member.mention} reputation "
-                f"**{MAX_REP_PER_TARGET_PER_24H} times in the last 24 hours**.\n"
-                f"Please wait before repping this user again.",
-                ephemeral=True,
-            )
-
-        rep_val, neg_val = add_positive_rep(member.id)
-        log_rep_action(interaction.user.id, member.id)
-
-        used_now = MAX_REP_PER_TARGET_PER_24H - remaining_before + 1
-        left_now = max(0, MAX_REP_PER_TARGET_PER_24H - used_now)
-
-        await interaction.followup.send(
-            f"{interaction.user.mention} repped {member.mention}\n"
-            f"👍 {member.mention} now has **{rep_val}** reputation\n"
-            f"🔰 Level: **{get_trading_level(rep_val)}**\n"
-            f"🕒 You have used **{used_now}/{MAX_REP_PER_TARGET_PER_24H}** reps for this user in the last 24 hours, You can give up to 3 rep to the same user every 24 hours "
-            f"({left_now} left)."
-        )
+        await give(interaction, member)
     except Exception as e:
-        print(f"/rep error: {e}")
+        print(f"/{command} error: {e}")
         await interaction.followup.send(
-            "❌ Something went wrong while giving reputation.",
+            f"❌ Something went wrong while {action}.",
             ephemeral=True,
         )
 
-@bot.tree.command(name="norep", description="Give negative reputation (does not remove reputation)")
-@app_commands.checks.cooldown(1, 240)
-async def norep(interaction: discord.Interaction, member: discord.Member):
-    if member.bot or member.id == interaction.user.id:
-        return await interaction.response.send_message("❌ Invalid target.", ephemeral=True)
+async def _give_positive_rep(interaction: discord.Interaction, member: discord.Member):
+    result = await run_db(give_rep, interaction.user.id, member.id)
+    if result is None:
+        return await interaction.followup.send(
+            f"❌ You have already given {member.mention} reputation "
+            f"**{MAX_REP_PER_TARGET_PER_24H} times in the last 24 hours**.\n"
+            f"Please wait before repping this user again.",
+            ephemeral=True,
+        )
 
-    await interaction.response.defer()
+    rep_val, neg_val, used_now = result
+    left_now = max(0, MAX_REP_PER_TARGET_PER_24H - used_now)
 
-    try:
-        rep_val, neg_val = add_negative_rep(member.id)
+    await interaction.followup.send(
+        f"{interaction.user.mention} repped {member.mention}\n"
+        f"👍 {member.mention} now has **{rep_val}** reputation\n"
+        f"🔰 Level: **{get_trading_level(rep_val)}**\n"
+        f"🕒 You have used **{used_now}/{MAX_REP_PER_TARGET_PER_24H}** reps for this user in the last 24 hours, "
+        f"You can give up to {MAX_REP_PER_TARGET_PER_24H} rep to the same user every 24 hours "
+        f"({left_now} left)."
+    )
 
-        await interaction.followup.send(
-            f"{interaction.user.mention} gave negative reputation to {member.mention}\n"
-            f"👍 {member.mention} still has **{rep_val}** positive reputation\n"
-            f"👎 {member.mention} now has **{neg_val}** negative reputation"
-        )
-    except Exception as e:
-        print(f"/norep error: {e}")
-        await interaction.followup.send(
-            "❌ Something went wrong while giving negative reputation.",
-            ephemeral=True,
-        )
+async def _give_negative_rep(interaction: discord.Interaction, member: discord.Member):
+    rep_val, neg_val = await run_db(add_negative_rep, member.id)
+
+    await interaction.followup.send(
+        f"{interaction.user.mention} gave negative reputation to {member.mention}\n"
+        f"👍 {member.mention} still has **{rep_val}** positive reputation\n"
+        f"👎 {member.mention} now has **{neg_val}** negative reputation"
+    )
+
+@bot.tree.command(name="rep", description="Give positive reputation")
+@app_commands.checks.cooldown(1, 240)
+async def rep(interaction: discord.Interaction, member: discord.Member):
+    await _apply_rep(interaction, member, _give_positive_rep, "rep", "giving reputation")
+
+@bot.tree.command(name="norep", description="Give negative reputation (does not remove reputation)")
+@app_commands.checks.cooldown(1, 240)
+async def norep(interaction: discord.Interaction, member: discord.Member):
+    await _apply_rep(interaction, member, _give_negative_rep, "norep", "giving negative reputation")
 
 @bot.tree.command(name="setrep", description="Set a member's reputation to a specific value")
 async def setrep(interaction: discord.Interaction, member: discord.Member, reputation: int):
     if member.bot:
         return await interaction.response.send_message("❌ Invalid target.", ephemeral=True)
 
-    _, neg_val = get_rep_data(member.id)
-    set_rep_data(member.id, reputation, neg_val)
-
-    rep_val, neg_val = get_rep_data(member.id)
+    rep_val, neg_val = await run_db(set_positive_rep, member.id, reputation)
 
     await interaction.response.send_message(
         f"🛠️ Reputation set by {interaction.user.mention} → {member.mention}\n"
@@ -489,10 +778,7 @@ async def setnegativerep(interaction: discord.Interaction, member: discord.Membe
     if member.bot:
         return await interaction.response.send_message("❌ Invalid target.", ephemeral=True)
 
-    rep_val, _ = get_rep_data(member.id)
-    set_rep_data(member.id, rep_val, negative_reputation)
-
-    rep_val, neg_val = get_rep_data(member.id)
+    rep_val, neg_val = await run_db(set_negative_rep, member.id, negative_reputation)
 
     await interaction.response.send_message(
         f"🛠️ Negative Reputation set by {interaction.user.mention} → {member.mention}\n"
@@ -502,11 +788,12 @@ async def setnegativerep(interaction: discord.Interaction, member: discord.Membe
 @bot.tree.command(name="checkrep", description="Check reputation status")
 async def checkrep(interaction: discord.Interaction, member: Optional[discord.Member] = None):
     member = member or interaction.user
-    rep_val, neg_val = get_rep_data(member.id)
+    rep_val, neg_val, rank = await run_db(get_rep_standing, member.id)
 
     await interaction.response.send_message(
         f"📊 {member.mention}\n"
-        f"{compact_stats(rep_val, neg_val)}"
+        f"{compact_stats(rep_val, neg_val)}\n"
+        f"🏅 **Rank:** {f'#{rank}' if rank else 'Unranked'}"
     )
 
 @bot.tree.command(name="rephistory", description="View all positive rep history received by a member")
@@ -514,7 +801,7 @@ async def rephistory(interaction: discord.Interaction, member: discord.Member):
     await interaction.response.defer()
 
     try:
-        rows = get_received_rep_history(member.id)
+        rows = await run_db(get_received_rep_history, member.id)
 
         if not rows:
             return await interaction.followup.send(
@@ -522,10 +809,13 @@ async def rephistory(interaction: discord.Interaction, member: discord.Member):
                 ephemeral=True,
             )
 
-        formatted_rows = []
-        for giver_id, receiver_id, given_at in rows:
-            giver_name = await resolve_user_name(interaction.guild, bot, giver_id)
-            formatted_rows.append((giver_name, format_dt(given_at)))
+        names = await resolve_user_names(
+            interaction.guild, bot, (giver_id for giver_id, _, _ in rows)
+        )
+        formatted_rows = [
+            (names[giver_id], format_dt(given_at))
+            for giver_id, receiver_id, given_at in rows
+        ]
 
         chunks = [
             formatted_rows[i:i + REP_HISTORY_PAGE_SIZE]
@@ -569,15 +859,14 @@ async def rephistory(interaction: discord.Interaction, member: discord.Member):
 
 @bot.tree.command(name="leaderboard", description="View the reputation leaderboard")
 async def leaderboard(interaction: discord.Interaction):
-    items = get_sorted_rep_items()
-    if not items:
+    total = await run_db(get_total_count)
+    if not total:
         return await interaction.response.send_message(
             "📭 No reputation data yet.",
             ephemeral=True
         )
 
-    embed = await make_leaderboard_embed(items, 0, interaction.guild, bot, interaction.user.id)
-    view = LeaderboardView(items, interaction.guild, bot, interaction.user.id)
+    view, embed = await LeaderboardView.create(total, interaction.guild, bot, interaction.user.id)
     await interaction.response.send_message(embed=embed, view=view)
 
 # ========================
@@ -588,48 +877,28 @@ async def leaderboard(interaction: discord.Interaction):
 async def importrep(interaction: discord.Interaction, file: discord.Attachment):
     await interaction.response.defer(ephemeral=True)
 
+    if file.size > MAX_IMPORT_BYTES:
+        return await interaction.followup.send(
+            f"❌ JSON file is too large (max **{MAX_IMPORT_BYTES // (1024 * 1024)} MB**).",
+            ephemeral=True
+        )
+
     try:
         raw = await file.read()
-        data = json.loads(raw)
+        result = await run_db(import_rep_json, raw)
 
-        if not isinstance(data, dict):
+        if result is None:
             return await interaction.followup.send(
                 "❌ JSON file must contain an object/dictionary.",
                 ephemeral=True
             )
 
-        imported = 0
-
-        with get_db() as conn:
-            for uid_str, val in data.items():
-                uid = int(uid_str)
-
-                if isinstance(val, dict):
-                    rep_val = int(val.get("reputation", val.get("rep", 0)))
-                    neg_val = int(val.get("negative_reputation", val.get("neg_rep", 0)))
-                else:
-                    rep_val = int(val)
-                    neg_val = 0
-
-                rep_val = max(0, rep_val)
-                neg_val = max(0, neg_val)
-
-                conn.execute("""
-                INSERT INTO reputation (user_id, rep, neg_rep, updated_at)
-                VALUES (?, ?, ?, ?)
-                ON CONFLICT(user_id)
-                DO UPDATE SET rep = excluded.rep,
-                              neg_rep = excluded.neg_rep,
-                              updated_at = excluded.updated_at
-                """, (uid, rep_val, neg_val, utc_now_iso()))
-                imported += 1
+        imported, skipped = result
+        message = f"✅ Reputation imported for **{imported}** user(s)."
+        if skipped:
+            message += f" Skipped **{skipped}** invalid row(s)."
 
-            conn.commit()
-
-        await interaction.followup.send(
-            f"✅ Reputation imported for **{imported}** user(s).",
-            ephemeral=True
-        )
+        await interaction.followup.send(message, ephemeral=True)
 
     except Exception as e:
         print(f"/importrep error: {e}")
@@ -641,24 +910,12 @@ async def importrep(interaction: discord.Interaction, file: discord.Attachment):
 @bot.tree.command(name="exportrep", description="Export reputation to JSON")
 async def exportrep(interaction: discord.Interaction):
     try:
-        with get_db() as conn:
-            rows = conn.execute("SELECT user_id, rep, neg_rep FROM reputation").fetchall()
-
-        path = "/tmp/rep_export.json"
-        payload = {
-            str(uid): {
-                "reputation": rep,
-                "negative_reputation": neg,
-            }
-            for uid, rep, neg in rows
-        }
-
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(payload, f, indent=2)
-
-        await interaction.response.send_message(
+        await interaction.response.defer(ephemeral=True)
+        export = await run_db(build_rep_export)
+
+        await interaction.followup.send(
             "📦 Reputation export:",
-            file=discord.File(path),
+            file=discord.File(export, filename="rep_export.json"),
             ephemeral=True,
         )
     except Exception as e:
@@ -672,4 +929,12 @@ async def exportrep(interaction: discord.Interaction):
 # RUN
 # ========================
 
-bot.run(TOKEN)
+if __name__ == "__main__":
+    load_dotenv()
+    TOKEN = os.getenv("DISCORD_TOKEN")
+    if not TOKEN:
+        raise ValueError("DISCORD_TOKEN missing")
+
+    CONN = open_db()
+    init_db()
+    bot.run(TOKEN)
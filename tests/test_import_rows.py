@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+
+import main
+
+
+class ImportRepJsonTest(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+
+        conn = main.open_db(os.path.join(tmpdir.name, "reputation.db"))
+        self.addCleanup(conn.close)
+        self.addCleanup(setattr, main, "CONN", main.CONN)
+        main.CONN = conn
+        main.init_db()
+
+    def stored_rows(self):
+        return main.CONN.execute(
+            "SELECT user_id, rep, neg_rep FROM reputation ORDER BY user_id"
+        ).fetchall()
+
+    def test_oversized_rows_are_skipped_and_valid_rows_import(self):
+        raw = (
+            b'{"1": 5,'
+            b' "2": {"rep": 3, "neg_rep": 2},'
+            b' "9223372036854775808": 1,'
+            b' "3": 9223372036854775808,'
+            b' "4": {"reputation": 1, "negative_reputation": 18446744073709551616},'
+            b' "5": {"reputation": 9, "negative_reputation": 1}}'
+        )
+
+        self.assertEqual(main.import_rep_json(raw), (3, 3))
+        self.assertEqual(self.stored_rows(), [(1, 5, 0), (2, 3, 2), (5, 9, 1)])
+
+    def test_malformed_and_non_positive_rows_are_skipped(self):
+        raw = b'{"0": 1, "-7": 1, "abc": 1, "8": "bad", "9": {"rep": [1]}, "10": 4}'
+
+        self.assertEqual(main.import_rep_json(raw), (1, 5))
+        self.assertEqual(self.stored_rows(), [(10, 4, 0)])
+
+    def test_negative_values_are_clamped(self):
+        raw = b'{"11": -5, "12": {"rep": -18446744073709551616, "neg_rep": -1}}'
+
+        self.assertEqual(main.import_rep_json(raw), (2, 0))
+        self.assertEqual(self.stored_rows(), [(11, 0, 0), (12, 0, 0)])
+
+    def test_non_object_payload_is_rejected(self):
+        self.assertIsNone(main.import_rep_json(b"[1, 2, 3]"))
+        self.assertEqual(self.stored_rows(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()